@@ -11,3 +11,6 @@ class RedactedUploaderConfig(AppConfig):
         ExecutorRegistry.register_executor(redacted_torrent_source.RedactedTorrentSourceExecutor)
         ExecutorRegistry.register_executor(redacted_upload_transcode.RedactedUploadTranscodeExecutor)
         ExecutorRegistry.register_executor(redacted_check_file_tags.RedactedCheckFileTags)
+
+        from .scan_coordination import install_shared_rate_limit
+        install_shared_rate_limit()
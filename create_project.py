@@ -1,13 +1,20 @@
+import json
+
 from django.db import transaction
 from rest_framework import status
 from rest_framework.exceptions import APIException
 
 from plugins.redacted.client import RedactedClient
+from plugins.redacted.request_cache import RedactedRequestCache
 from plugins.redacted.tracker import RedactedTrackerPlugin
 from plugins.redacted.utils import get_shorter_joined_artists
+from plugins.redacted_uploader.disk_space import check_disk_space, get_source_size, lock_admission
 from plugins.redacted_uploader.executors.redacted_check_file_tags import RedactedCheckFileTags
 from plugins.redacted_uploader.executors.redacted_torrent_source import RedactedTorrentSourceExecutor
 from plugins.redacted_uploader.executors.redacted_upload_transcode import RedactedUploadTranscodeExecutor
+from plugins.redacted_uploader.preflight import run_preflight, PreflightFailed
+from plugins.redacted_uploader.transcode_types import TRANSCODE_TYPE_MP3_V0, TRANSCODE_TYPE_MP3_320, \
+    TRANSCODE_TYPE_REDBOOK_FLAC, TRANSCODE_TYPES
 from torrents.add_torrent import add_torrent_from_tracker, fetch_torrent
 from torrents.models import Torrent, Realm
 from trackers.registry import TrackerRegistry
@@ -19,46 +26,21 @@ from upload_studio.models import Project, ProjectStep
 from upload_studio.tasks import project_run_all
 from upload_studio.upload_metadata import MusicMetadata
 
-TRANSCODE_TYPE_MP3_V0 = 'mp3_v0'
-TRANSCODE_TYPE_MP3_320 = 'mp3_320'
-TRANSCODE_TYPE_REDBOOK_FLAC = 'redbook_flac'
-TRANSCODE_TYPES = {
-    TRANSCODE_TYPE_MP3_V0,
-    TRANSCODE_TYPE_MP3_320,
-    TRANSCODE_TYPE_REDBOOK_FLAC,
-}
 
+class NoProjectSlotAvailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'All project slots are in use.'
+    default_code = 'no_project_slot_available'
 
-@transaction.atomic
-def create_transcode_project(tracker_id, transcode_type):
-    if transcode_type not in TRANSCODE_TYPES:
-        raise APIException(
-            'Unknown transcode type. Supported types: {}'.format(TRANSCODE_TYPES),
-            code=status.HTTP_400_BAD_REQUEST,
-        )
-    tracker = TrackerRegistry.get_plugin(RedactedTrackerPlugin.name, 'transcode_torrent')
-    realm = Realm.objects.get(name=RedactedTrackerPlugin.name)
-    download_location = realm.get_preferred_download_location()
-    if not download_location:
-        raise APIException(
-            'No download location available for realm {}'.format(realm.name),
-            code=status.HTTP_400_BAD_REQUEST,
-        )
-    torrent_info = fetch_torrent(
-        realm=realm,
-        tracker=tracker,
-        tracker_id=tracker_id,
-        force_fetch=True,
-    )
-    try:
-        torrent = torrent_info.torrent
-    except Torrent.DoesNotExist:
-        torrent = add_torrent_from_tracker(
-            tracker=tracker,
-            tracker_id=tracker_id,
-            download_path_pattern=download_location.pattern,
-            force_fetch=False,
-        )
+
+def preflight_transcode(torrent_info, transcode_type, group_dict=None):
+    red_torrent = json.loads(bytes(torrent_info.raw_response).decode())['torrent']
+    if group_dict is None:
+        group_dict = RedactedRequestCache().get_torrent_group(torrent_info.redacted_torrent.torrent_group_id, 60 * 5)
+    return run_preflight(red_torrent, group_dict['torrents'], transcode_type)
+
+
+def _create_project(transcode_type, torrent_info, torrent, announce):
     torrent_group = torrent_info.redacted_torrent.torrent_group
     project = Project.objects.create(
         media_type=Project.MEDIA_TYPE_MUSIC,
@@ -97,7 +79,7 @@ def create_transcode_project(tracker_id, transcode_type):
     project.steps.append(ProjectStep(
         executor_name=CreateTorrentFileExecutor.name,
         executor_kwargs={
-            'announce': RedactedClient().get_announce(),
+            'announce': announce,
             'extra_info_keys': {
                 'source': 'RED',
             }
@@ -110,7 +92,65 @@ def create_transcode_project(tracker_id, transcode_type):
         executor_name=FinishUploadExecutor.name,
     ))
     project.save_steps()
-    # If the torrent is complete, launch it. Otherwise the torrent_finished receiver will start it when received.
-    if torrent.progress == 1:
-        project_run_all.delay(project.id)
+    return project
+
+
+def create_transcode_project(tracker_id, transcode_type, allow_warnings=True, group_dict=None,
+                             max_unfinished_projects=None):
+    if transcode_type not in TRANSCODE_TYPES:
+        raise APIException(
+            'Unknown transcode type. Supported types: {}'.format(TRANSCODE_TYPES),
+            code=status.HTTP_400_BAD_REQUEST,
+        )
+    tracker = TrackerRegistry.get_plugin(RedactedTrackerPlugin.name, 'transcode_torrent')
+    realm = Realm.objects.get(name=RedactedTrackerPlugin.name)
+    download_location = realm.get_preferred_download_location()
+    if not download_location:
+        raise APIException(
+            'No download location available for realm {}'.format(realm.name),
+            code=status.HTTP_400_BAD_REQUEST,
+        )
+    # Tracker requests happen before taking the admission lock, to not serialize creations behind network I/O
+    torrent_info = fetch_torrent(
+        realm=realm,
+        tracker=tracker,
+        tracker_id=tracker_id,
+        force_fetch=True,
+    )
+    preflight_result = preflight_transcode(torrent_info, transcode_type, group_dict)
+    if preflight_result.errors or (preflight_result.warnings and not allow_warnings):
+        raise PreflightFailed(preflight_result)
+    announce = RedactedClient().get_announce()
+
+    with transaction.atomic():
+        lock_admission()
+        if max_unfinished_projects is not None:
+            if Project.objects.filter(is_finished=False).count() >= max_unfinished_projects:
+                raise NoProjectSlotAvailable()
+        try:
+            torrent = torrent_info.torrent
+        except Torrent.DoesNotExist:
+            torrent = None
+        project = _create_project(transcode_type, torrent_info, torrent, announce)
+        # Runs before the torrent is added to the client, so a refusal rolls back the project and leaves nothing
+        check_disk_space(
+            project_data_path=project.steps[0].data_path,
+            source_size=get_source_size(torrent_info),
+            transcode_type=transcode_type,
+            download_location=download_location,
+            is_source_local=torrent is not None,
+            exclude_project_id=project.id,
+        )
+        if torrent is None:
+            torrent = add_torrent_from_tracker(
+                tracker=tracker,
+                tracker_id=tracker_id,
+                download_path_pattern=download_location.pattern,
+                force_fetch=False,
+            )
+            project.source_torrent = torrent
+            project.save(update_fields=('source_torrent',))
+        # If the torrent is complete, launch it. Otherwise the torrent_finished receiver will start it when received.
+        if torrent.progress == 1:
+            project_run_all.delay(project.id)
     return project
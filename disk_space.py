@@ -0,0 +1,189 @@
+import json
+import os
+import shutil
+from collections import namedtuple
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from Harvest.utils import get_logger
+from plugins.redacted_uploader.models import AdmissionLock
+from plugins.redacted_uploader.transcode_types import TRANSCODE_TYPE_MP3_V0, TRANSCODE_TYPE_MP3_320, \
+    TRANSCODE_TYPE_REDBOOK_FLAC
+from upload_studio.models import Project, ProjectStep
+
+logger = get_logger(__name__)
+
+PROJECT_TYPE_PREFIX = 'redacted_transcode_'
+
+# Extra space that must remain free on a volume after all reservations.
+MIN_FREE_SPACE_MARGIN = 2 * 1024 ** 3
+
+# Approximate size of the sox output relative to the source torrent.
+SOX_OUTPUT_RATIOS = {
+    TRANSCODE_TYPE_MP3_V0: 1.0,  # Sources are mostly redbook already, sox rarely shrinks them.
+    TRANSCODE_TYPE_MP3_320: 1.0,
+    TRANSCODE_TYPE_REDBOOK_FLAC: 0.7,  # 24bit/44.1khz sources only lose the extra 8 bits.
+}
+# Approximate size of the final upload relative to the source torrent.
+OUTPUT_RATIOS = {
+    TRANSCODE_TYPE_MP3_V0: 0.3,
+    TRANSCODE_TYPE_MP3_320: 0.4,
+    TRANSCODE_TYPE_REDBOOK_FLAC: 0.7,
+}
+# Steps after the transcode that copy the output into their own data path
+# (check file tags, create torrent file, upload transcode).
+NUM_OUTPUT_COPIES = 3
+
+ProjectFootprint = namedtuple('ProjectFootprint', ['project_bytes', 'download_bytes'])
+
+
+class InsufficientDiskSpace(APIException):
+    status_code = status.HTTP_507_INSUFFICIENT_STORAGE
+    default_detail = 'Insufficient disk space to run the project.'
+    default_code = 'insufficient_disk_space'
+
+
+def get_source_size(torrent_info):
+    return json.loads(bytes(torrent_info.raw_response).decode())['torrent']['size']
+
+
+def estimate_project_footprint(source_size, transcode_type):
+    """Estimate the peak disk usage of a transcode project of a source torrent of size source_size."""
+
+    output_bytes = source_size * OUTPUT_RATIOS[transcode_type]
+    project_bytes = source_size + source_size * SOX_OUTPUT_RATIOS[transcode_type] + output_bytes * NUM_OUTPUT_COPIES
+    if transcode_type != TRANSCODE_TYPE_REDBOOK_FLAC:
+        project_bytes += output_bytes  # LAME writes its own step on top of sox
+    return ProjectFootprint(int(project_bytes), int(output_bytes))
+
+
+def _get_existing_path(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def _get_volume_id(path):
+    return os.stat(_get_existing_path(path)).st_dev
+
+
+def get_download_location_root(download_location):
+    # Patterns look like /downloads/{tracker}/..., so anything before the first placeholder is a real path.
+    return download_location.pattern.split('{', 1)[0] or '/'
+
+
+def _get_dir_size(path):
+    # Running projects create and delete temporary files while this walks them
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += _get_dir_size(entry.path)
+            else:
+                total += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def _get_reserved_bytes(shared_volume, exclude_project_id):
+    """Returns the bytes still to be written by unfinished transcode projects on the project and download volumes.
+    Whatever they already wrote is excluded from the free space, so only the rest of the estimate is reserved.
+    Projects that errored out are not going to write anything more until someone looks at them."""
+
+    reserved_project_bytes = 0
+    reserved_download_bytes = 0
+    projects = Project.objects.filter(
+        is_finished=False,
+        project_type__startswith=PROJECT_TYPE_PREFIX,
+    ).exclude(id=exclude_project_id).select_related('source_torrent__torrent_info')
+    for project in projects:
+        transcode_type = project.project_type[len(PROJECT_TYPE_PREFIX):]
+        if transcode_type not in OUTPUT_RATIOS or not project.source_torrent:
+            continue
+        if any(step.status == ProjectStep.STATUS_ERRORS for step in project.steps):
+            continue
+        source_size = get_source_size(project.source_torrent.torrent_info)
+        footprint = estimate_project_footprint(source_size, transcode_type)
+        written_bytes = sum(_get_dir_size(step.data_path) for step in project.steps)
+        reserved_project_bytes += max(footprint.project_bytes - written_bytes, 0)
+        # The source might still be downloading, then the output is stored next to it
+        remaining_download_bytes = footprint.download_bytes + int(source_size * (1 - project.source_torrent.progress))
+        if shared_volume:
+            reserved_project_bytes += remaining_download_bytes
+        else:
+            reserved_download_bytes += remaining_download_bytes
+    return reserved_project_bytes, reserved_download_bytes
+
+
+def _check_volume(path, required_bytes, reserved_bytes):
+    free_bytes = shutil.disk_usage(_get_existing_path(path)).free
+    available_bytes = free_bytes - reserved_bytes - MIN_FREE_SPACE_MARGIN
+    if available_bytes < required_bytes:
+        raise InsufficientDiskSpace(
+            'Not enough space on {}: project needs {} bytes, {} bytes are free and {} are reserved.'.format(
+                path, required_bytes, free_bytes, reserved_bytes),
+        )
+
+
+def _check_disk_space(project_data_path, source_size, transcode_type, download_location, is_source_local,
+                      exclude_project_id=None):
+    footprint = estimate_project_footprint(source_size, transcode_type)
+    download_bytes = footprint.download_bytes
+    if not is_source_local:
+        download_bytes += source_size
+    download_path = get_download_location_root(download_location)
+    shared_volume = _get_volume_id(project_data_path) == _get_volume_id(download_path)
+    reserved_project_bytes, reserved_download_bytes = _get_reserved_bytes(shared_volume, exclude_project_id)
+
+    logger.debug('Estimated footprint {} for {} with {}/{} bytes reserved.',
+                 footprint, transcode_type, reserved_project_bytes, reserved_download_bytes)
+    if shared_volume:
+        _check_volume(project_data_path, footprint.project_bytes + download_bytes, reserved_project_bytes)
+    else:
+        _check_volume(project_data_path, footprint.project_bytes, reserved_project_bytes)
+        _check_volume(download_path, download_bytes, reserved_download_bytes)
+
+
+def has_disk_space(source_size, transcode_type, download_location, is_source_local):
+    """Unlocked version of check_disk_space, for waiting on space before doing any work towards a project. Uses the
+    data path of the latest project for the project volume. Without any project, the check is left to
+    check_disk_space."""
+
+    latest_project = Project.objects.order_by('-id').first()
+    if latest_project is None or not latest_project.steps:
+        return True
+    try:
+        _check_disk_space(latest_project.steps[0].data_path, source_size, transcode_type, download_location,
+                          is_source_local)
+    except InsufficientDiskSpace:
+        return False
+    return True
+
+
+def lock_admission():
+    """Serialize project creation until the current transaction commits, so concurrent creations see each other's
+    projects."""
+
+    AdmissionLock.objects.select_for_update().get(name=AdmissionLock.NAME_DISK_SPACE)
+
+
+def check_disk_space(project_data_path, source_size, transcode_type, download_location, is_source_local,
+                     exclude_project_id=None):
+    """Verify that the volume of project_data_path and the download volume can fit a new project on top of the space
+    still needed by all unfinished transcode projects, except exclude_project_id. Raises InsufficientDiskSpace
+    otherwise.
+
+    Must be called inside a transaction holding lock_admission(), before any side effect of creating the project."""
+
+    _check_disk_space(project_data_path, source_size, transcode_type, download_location, is_source_local,
+                      exclude_project_id)
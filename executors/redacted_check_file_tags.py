@@ -2,7 +2,8 @@ import os
 from itertools import groupby
 
 from Harvest.path_utils import list_rel_files
-from plugins.redacted_uploader.executors.utils import RedactedStepExecutorMixin, shorten_filename_if_necessary
+from plugins.redacted_uploader.executors.utils import RedactedStepExecutorMixin, plan_shortened_filenames, \
+    apply_renames, FilenameShorteningError
 from plugins.redacted_uploader.torrent_name import get_torrent_name_for_upload
 from upload_studio.audio_utils import AudioDiscoveryStepMixin
 from upload_studio.step_executor import StepExecutor
@@ -34,8 +35,11 @@ class RedactedCheckFileTags(AudioDiscoveryStepMixin, RedactedStepExecutorMixin,
             self.check_tags_for_file(audio_file)
 
     def shorten_filenames_if_necessary(self):
-        for rel_path in list_rel_files(self.step.data_path):
-            shorten_filename_if_necessary(self.metadata.torrent_name, self.step.data_path, rel_path)
+        try:
+            renames = plan_shortened_filenames(self.metadata.torrent_name, list_rel_files(self.step.data_path))
+        except FilenameShorteningError as exc:
+            self.raise_error('Unable to shorten filenames:\n{}'.format(exc))
+        apply_renames(self.step.data_path, renames)
 
     def check_track_numbers_sort_order(self):
         for dir_path, dir_files in groupby(self.audio_files, lambda f: os.path.dirname(f.abs_path)):
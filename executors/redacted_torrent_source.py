@@ -7,6 +7,7 @@ from Harvest.path_utils import list_src_dst_files
 from Harvest.utils import get_logger
 from plugins.redacted.models import RedactedTorrentGroup
 from plugins.redacted_uploader.executors.utils import RedactedStepExecutorMixin
+from plugins.redacted_uploader.preflight import get_source_warnings
 from torrents.add_torrent import fetch_torrent
 from upload_studio.step_executor import StepExecutor
 from upload_studio.upload_metadata import MusicMetadata
@@ -14,10 +15,6 @@ from upload_studio.upload_metadata import MusicMetadata
 logger = get_logger(__name__)
 
 
-def _has_surronding_spaces(s):
-    return s != s.strip()
-
-
 class RedactedTorrentSourceExecutor(RedactedStepExecutorMixin, StepExecutor):
     name = 'redacted_torrent_source'
     description = 'Source data from Redacted torrent {source_torrent.torrent_info.tracker_id}.'
@@ -56,16 +53,8 @@ class RedactedTorrentSourceExecutor(RedactedStepExecutorMixin, StepExecutor):
                     self.red_torrent['remasterYear']))
 
     def check_source_warnings(self):
-        if self.red_torrent['scene']:
-            self.add_warning('Attention: source torrent is scene.')
-        if self.red_torrent['reported']:
-            self.add_warning('Source torrent is reported.')
-        if _has_surronding_spaces(self.red_torrent['remasterTitle']):
-            self.add_warning('Edition title has leading or trailing spaces. Fix manually now or after upload.')
-        if _has_surronding_spaces(self.red_torrent['remasterRecordLabel']):
-            self.add_warning('Edition record label has leading or trailing spaces. Fix manually now or after upload.')
-        if _has_surronding_spaces(self.red_torrent['remasterCatalogueNumber']):
-            self.add_warning('Edition catalog number has leading or trailing spaces. Fix manually now or after upload.')
+        for warning in get_source_warnings(self.red_torrent):
+            self.add_warning(warning)
 
     def copy_source_files(self):
         download_path = os.path.join(self.torrent.download_path, self.torrent.name)
@@ -5,6 +5,7 @@ from Harvest.path_utils import copytree_into
 from Harvest.utils import get_logger
 from plugins.redacted.exceptions import RedactedUploadException, RedactedException
 from plugins.redacted_uploader.executors.utils import RedactedStepExecutorMixin
+from plugins.redacted_uploader.preflight import get_metadata_warnings, get_duplicate_warnings
 from torrents import add_torrent
 from upload_studio.audio_utils import AudioDiscoveryStepMixin
 from upload_studio.step_executor import StepExecutor
@@ -12,8 +13,6 @@ from upload_studio.upload_metadata import MusicMetadata
 
 logger = get_logger(__name__)
 
-PRE_EMPHASIS_TERMS = {'pre-emphasized', 'pre-emphasis', 'preemphasized', 'pre-emphasis'}
-
 
 class RedactedUploadTranscodeExecutor(AudioDiscoveryStepMixin, RedactedStepExecutorMixin, StepExecutor):
     name = 'redacted_upload_transcode'
@@ -72,40 +71,30 @@ class RedactedUploadTranscodeExecutor(AudioDiscoveryStepMixin, RedactedStepExecu
                 self.raise_error('Blu-Ray lossy data must be uploaded in redbook format.')
 
     def check_metadata(self):
-        red_torrent = self.metadata.additional_data['source_red_torrent']
-
-        is_preemphasized = (any(term in red_torrent['remasterTitle'].lower() for term in PRE_EMPHASIS_TERMS) or
-                            any(term in red_torrent['description'].lower() for term in PRE_EMPHASIS_TERMS))
-        if is_preemphasized:
-            self.add_warning('Source torrent looks like it might be pre-emphasized. De-emphasizing is not supported.'
-                             ' Please check the source torrent and do it manually if needed.')
-
-        if not self.metadata.edition_year:
-            self.add_warning('Metadata has empty year.')
-        has_any_edition_information = (
-                self.metadata.edition_title or
-                self.metadata.edition_record_label or
-                self.metadata.edition_catalog_number
+        warnings = get_metadata_warnings(
+            red_torrent=self.metadata.additional_data['source_red_torrent'],
+            edition_year=self.metadata.edition_year,
+            edition_title=self.metadata.edition_title,
+            edition_record_label=self.metadata.edition_record_label,
+            edition_catalog_number=self.metadata.edition_catalog_number,
         )
-        if not has_any_edition_information:
-            self.add_warning('Metadata has empty title, label and catalog number.')
+        for warning in warnings:
+            self.add_warning(warning)
 
     def detect_duplicates(self):
         red_group = self.client.get_torrent_group(self.metadata.additional_data['source_red_group']['id'])
-        for t in red_group['torrents']:
-            is_same = (
-                    t['format'] == self.metadata.format and
-                    t['media'] == self.metadata.media and
-                    t['encoding'] == self.metadata.encoding and
-                    t['remastered'] == True and  # Can remastered be False with newer Red Gazelle?
-                    t['remasterYear'] == self.metadata.edition_year and
-                    t['remasterTitle'] == self.metadata.edition_title and
-                    t['remasterRecordLabel'] == self.metadata.edition_record_label and
-                    t['remasterCatalogueNumber'] == self.metadata.edition_catalog_number
-            )
-            if is_same:
-                self.add_warning('Torrent will potentially duplicate Red torrent {}. Please confirm manually.'.format(
-                    t['id']))
+        warnings = get_duplicate_warnings(
+            group_torrents=red_group['torrents'],
+            format=self.metadata.format,
+            media=self.metadata.media,
+            encoding=self.metadata.encoding,
+            edition_year=self.metadata.edition_year,
+            edition_title=self.metadata.edition_title,
+            edition_record_label=self.metadata.edition_record_label,
+            edition_catalog_number=self.metadata.edition_catalog_number,
+        )
+        for warning in warnings:
+            self.add_warning(warning)
 
     def _get_torrent_file(self):
         torrent_area = self.step.get_area_path('torrent_file')
@@ -17,26 +17,76 @@ class RedactedStepExecutorMixin:
         self.realm = Realm.objects.get(name=self.tracker.name)
 
 
-def shorten_filename_if_necessary(torrent_name, root, rel_path):
-    len_debt = len(rel_path) + len(torrent_name) + 1 - 180  # 1 for the /
+MAX_TORRENT_PATH_LENGTH = 180
+MIN_SHORTENED_FILENAME_LENGTH = 40
+
+
+class FilenameShorteningError(Exception):
+    def __init__(self, errors):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+
+def get_shortened_rel_path(torrent_name, rel_path):
+    """Returns the path rel_path needs to be renamed to so that it fits in the torrent, or None if it already fits.
+    Raises ValueError if the filename can not be shortened enough."""
+
+    len_debt = len(rel_path) + len(torrent_name) + 1 - MAX_TORRENT_PATH_LENGTH  # 1 for the /
     if len_debt <= 0:
-        return
+        return None
 
     filename = os.path.basename(rel_path)
     dirname = os.path.dirname(rel_path)
 
     new_len = len(filename) - len_debt
-    if new_len < 40:
-        raise Exception('Shortening the filename will make it less than 40 chars - {0}'.format(new_len))
+    if new_len < MIN_SHORTENED_FILENAME_LENGTH:
+        raise ValueError('Shortening {} will make the filename less than {} chars - {}'.format(
+            rel_path, MIN_SHORTENED_FILENAME_LENGTH, new_len))
 
     filename_root, filename_ext = os.path.splitext(filename)
     new_filename = filename_root[:-(len_debt + 3)] + '...' + filename_ext
-    new_rel_path = os.path.join(dirname, new_filename)
+    return os.path.join(dirname, new_filename)
+
+
+def plan_shortened_filenames(torrent_name, rel_paths):
+    """Computes all renames needed for rel_paths to fit in the torrent. Every violation, including collisions with
+    existing files or between planned renames, is reported at once in a FilenameShorteningError."""
+
+    rel_paths = set(rel_paths)
+    renames = []
+    errors = []
+    targets = {}
+    for rel_path in sorted(rel_paths):
+        try:
+            new_rel_path = get_shortened_rel_path(torrent_name, rel_path)
+        except ValueError as exc:
+            errors.append(str(exc))
+            continue
+        if new_rel_path is None:
+            continue
+        if new_rel_path in rel_paths:
+            errors.append('Renaming {} to {} for shortening would cause a collision'.format(rel_path, new_rel_path))
+        elif new_rel_path in targets:
+            errors.append('Shortening both {} and {} would rename them to {}'.format(
+                targets[new_rel_path], rel_path, new_rel_path))
+        else:
+            targets[new_rel_path] = rel_path
+            renames.append((rel_path, new_rel_path))
+    if errors:
+        raise FilenameShorteningError(errors)
+    return renames
+
 
-    logger.info('Shortening {} to {}.', rel_path, new_rel_path)
+def apply_renames(root, renames):
+    """Applies all renames, rolling back the ones already done if any of them fails."""
 
-    src_path = os.path.join(root, rel_path)
-    dst_path = os.path.join(root, new_rel_path)
-    if os.path.exists(dst_path):
-        raise Exception('Renaming {} to {} for shortening would case a collision'.format(src_path, dst_path))
-    os.rename(src_path, dst_path)
+    done = []
+    try:
+        for rel_path, new_rel_path in renames:
+            logger.info('Shortening {} to {}.', rel_path, new_rel_path)
+            os.rename(os.path.join(root, rel_path), os.path.join(root, new_rel_path))
+            done.append((rel_path, new_rel_path))
+    except OSError:
+        for rel_path, new_rel_path in reversed(done):
+            os.rename(os.path.join(root, new_rel_path), os.path.join(root, rel_path))
+        raise
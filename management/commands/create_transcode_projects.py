@@ -0,0 +1,102 @@
+import json
+import sys
+from time import sleep
+
+from django.core.management import BaseCommand, CommandError
+from rest_framework.exceptions import APIException
+
+from plugins.redacted.tracker import RedactedTrackerPlugin
+from plugins.redacted_uploader.project_queue import create_transcode_project_when_possible, DECISION_CANDIDATE
+from plugins.redacted_uploader.transcode_types import TRANSCODE_TYPES
+from torrents.models import Torrent
+from upload_studio.models import Project
+
+RESULT_CREATED = 'created'
+RESULT_SKIPPED = 'skipped'
+RESULT_FAILED = 'failed'
+
+
+class Command(BaseCommand):
+    help = 'Create transcode projects from the JSON Lines output of scan_snatched_for_transcodes --jsonl.'
+
+    def _parse_records(self, lines):
+        records = []
+        errors = []
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                int(record['tracker_id'])
+                int(record['source_size'])
+                if record['transcode_type'] not in TRANSCODE_TYPES:
+                    raise ValueError('unknown transcode type {}'.format(record['transcode_type']))
+            except (ValueError, TypeError, KeyError) as exc:
+                errors.append('Line {}: invalid record ({}: {}).'.format(line_number, type(exc).__name__, exc))
+                continue
+            records.append(record)
+        if errors:
+            raise CommandError('\n'.join(errors))
+        return records
+
+    def _create_project(self, record, skip_warnings):
+        """Returns one of the RESULT_* values for the record."""
+
+        tracker_id = int(record['tracker_id'])
+        transcode_type = record['transcode_type']
+        print('{} {}:'.format(tracker_id, transcode_type))
+        is_source_local = Torrent.objects.filter(
+            realm__name=RedactedTrackerPlugin.name,
+            torrent_info__tracker_id=str(tracker_id),
+        ).exists()
+
+        def before_create():
+            # Re-running an import or importing an old stream must not duplicate projects
+            project_exists = Project.objects.filter(
+                source_torrent__realm__name=RedactedTrackerPlugin.name,
+                source_torrent__torrent_info__tracker_id=str(tracker_id),
+                project_type='redacted_transcode_{}'.format(transcode_type),
+            ).exists()
+            if project_exists:
+                print('  Project exists, skipping.')
+            return not project_exists
+
+        try:
+            project = create_transcode_project_when_possible(
+                tracker_id=tracker_id,
+                transcode_type=transcode_type,
+                source_size=int(record['source_size']),
+                is_source_local=is_source_local,
+                log=print,
+                allow_warnings=not skip_warnings,
+                before_create=before_create,
+            )
+        except APIException as exc:
+            print('  Failed: {}'.format(exc.detail))
+            return RESULT_FAILED
+        except Exception as exc:
+            # Tracker and network errors only concern this record, keep going with the rest of the batch
+            print('  Failed: {}: {}'.format(type(exc).__name__, exc))
+            return RESULT_FAILED
+        if project is None:
+            return RESULT_SKIPPED
+        sleep(5)
+        return RESULT_CREATED
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', default='-', help='JSON Lines file to read, - for stdin.')
+        parser.add_argument('--skip-warnings', default=False, action='store_true',
+                            help='Do not create projects for candidates with preflight warnings.')
+
+    def handle(self, *args, **options):
+        if options['file'] == '-':
+            lines = list(sys.stdin)
+        else:
+            with open(options['file']) as f:
+                lines = list(f)
+        records = self._parse_records(lines)
+        candidates = [r for r in records if r.get('decision', DECISION_CANDIDATE) == DECISION_CANDIDATE]
+        print('Read {} candidates out of {} records.'.format(len(candidates), len(records)))
+        results = [self._create_project(record, options['skip_warnings']) for record in candidates]
+        print('Created {} projects, skipped {} existing, {} failed.'.format(
+            results.count(RESULT_CREATED), results.count(RESULT_SKIPPED), results.count(RESULT_FAILED)))
@@ -1,23 +1,61 @@
 import html
+import json
+import os
+import socket
+import sys
 from time import sleep
 
 from django.core.management import BaseCommand
+from django.db.models import Max
 
 from plugins.redacted.models import RedactedTorrent
 from plugins.redacted.request_cache import RedactedRequestCache
 from plugins.redacted.tracker import RedactedTrackerPlugin
 from plugins.redacted.utils import get_joined_artists
 from plugins.redacted_uploader.create_project import TRANSCODE_TYPE_REDBOOK_FLAC, TRANSCODE_TYPE_MP3_V0, \
-    TRANSCODE_TYPE_MP3_320, create_transcode_project
+    TRANSCODE_TYPE_MP3_320, preflight_transcode
+from plugins.redacted_uploader.disk_space import get_source_size
+from plugins.redacted_uploader.preflight import PreflightFailed
+from plugins.redacted_uploader.project_queue import create_transcode_project_when_possible, DECISION_CANDIDATE, \
+    DECISION_EXISTS, DECISION_PROJECT_EXISTS
+from plugins.redacted_uploader.scan_coordination import ensure_work_units, reset_work_units, acquire_work_unit, \
+    renew_lease, complete_work_unit, LeaseLost
 from torrents.add_torrent import fetch_torrent
 from torrents.models import Torrent, Realm
 from trackers.registry import TrackerRegistry
 from upload_studio.models import Project
 
-NUM_CONCURRENT_PROJECTS = 4
-
 
 class Command(BaseCommand):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.node_name = None
+        self.work_unit = None
+        self.jsonl = False
+        self.skip_warnings = False
+
+    def _print(self, message):
+        # Keep stdout clean for the JSON Lines stream
+        print(message, file=sys.stderr if self.jsonl else sys.stdout)
+
+    def _emit_decision(self, torrent, transcode_type, decision, check, preflight_result=None):
+        if not self.jsonl:
+            return
+        print(json.dumps({
+            'tracker_id': int(torrent.torrent_info.tracker_id),
+            'group_id': torrent.torrent_info.redacted_torrent.torrent_group_id,
+            'transcode_type': transcode_type,
+            'source_size': get_source_size(torrent.torrent_info),
+            'decision': decision,
+            'check': check,
+            'preflight_errors': preflight_result.errors if preflight_result else [],
+            'preflight_warnings': preflight_result.warnings if preflight_result else [],
+        }), flush=True)
+
+    def _heartbeat(self):
+        if self.work_unit:
+            renew_lease(self.work_unit, self.node_name)
+
     def _match_edition(self, redacted_torrent, torrent_dict):
         return (
                 redacted_torrent.media == html.unescape(torrent_dict['media']) and
@@ -33,61 +71,96 @@ class Command(BaseCommand):
                 return True
         return False
 
-    def _create_transcode_project(self, torrent, transcode_type):
-        printed = False
-        while True:
-            if Project.objects.filter(is_finished=False).count() < NUM_CONCURRENT_PROJECTS:
-                break
-            if not printed:
-                print('  Waiting for project slots...')
-                printed = True
-            sleep(1)
-        tracker_id = torrent.torrent_info.tracker_id
-        print('  Creating project...')
-        create_transcode_project(tracker_id, transcode_type)
-        print('  Created project for https://redacted.ch/torrents.php?torrentid={}'.format(tracker_id))
-        sleep(5)
+    def _is_group_modified(self, group_dict, torrent_info):
+        cached_time = group_dict['group'].get('time')
+        fresh_group = json.loads(bytes(torrent_info.raw_response).decode())['group']
+        return not cached_time or cached_time != fresh_group.get('time')
+
+    def _project_exists(self, torrent, transcode_type):
+        return Project.objects.filter(
+            source_torrent=torrent,
+            project_type='redacted_transcode_{}'.format(transcode_type),
+        ).exists()
+
+    def _create_transcode_project(self, torrent, transcode_type, group_dict):
+        def before_create():
+            # Renewing the lease locks the work unit until the project is committed, so a node taking over an
+            # expired lease can not create the same project concurrently.
+            self._heartbeat()
+            if self._project_exists(torrent, transcode_type):
+                self._print('  Project exists.')
+                return False
+            return True
+
+        try:
+            project = create_transcode_project_when_possible(
+                tracker_id=torrent.torrent_info.tracker_id,
+                transcode_type=transcode_type,
+                source_size=get_source_size(torrent.torrent_info),
+                is_source_local=True,
+                log=self._print,
+                allow_warnings=not self.skip_warnings,
+                group_dict=group_dict,
+                on_wait=self._heartbeat,
+                before_create=before_create,
+            )
+        except PreflightFailed as exc:
+            self._print('  {}'.format(exc.detail))
+            return
+        if project:
+            sleep(5)
 
     def _check_torrent(self, progress, torrent, transcode_type, match_fn, auto_create):
         redacted_torrent = torrent.torrent_info.redacted_torrent
-        print('{} checking {}: {} - {}'.format(
+        self._print('{} checking {}: {} - {}'.format(
             progress,
             torrent.torrent_info.redacted_torrent.id,
             get_joined_artists(redacted_torrent.torrent_group.music_info),
             redacted_torrent.torrent_group.name,
         ))
-        existing_projects = Project.objects.filter(
-            source_torrent=torrent,
-            project_type='redacted_transcode_{}'.format(transcode_type),
-        )
-        if existing_projects.exists():
-            print('  Project exists.')
+        if self._project_exists(torrent, transcode_type):
+            self._print('  Project exists.')
+            self._emit_decision(torrent, transcode_type, DECISION_PROJECT_EXISTS, None)
             return
         # First fetch the group with a large TTL
         group_dict = self.request_cache.get_torrent_group(redacted_torrent.torrent_group_id, 60 * 60 * 24 * 7 * 2)
         if self._lookup_torrent_in_group(redacted_torrent, group_dict, match_fn):
-            print('  {} already exists (1).'.format(transcode_type))
-            return
-        # Fetch it again with a small TTL
-        group_dict = self.request_cache.get_torrent_group(redacted_torrent.torrent_group_id, 60 * 5)
-        if self._lookup_torrent_in_group(redacted_torrent, group_dict, match_fn):
-            print('  {} already exists (2).'.format(transcode_type))
+            self._print('  {} already exists (1).'.format(transcode_type))
+            self._emit_decision(torrent, transcode_type, DECISION_EXISTS, 1)
             return
+        # Refresh the torrent, which also carries the group's last modified time. Only re-download the full group
+        # when that differs from the cached one, as any torrent added to the group bumps it.
         torrent_info = fetch_torrent(self.realm, self.tracker, redacted_torrent.id, force_fetch=True)
+        if self._is_group_modified(group_dict, torrent_info):
+            group_dict = self.request_cache.get_torrent_group(redacted_torrent.torrent_group_id, 60 * 5)
+            if self._lookup_torrent_in_group(redacted_torrent, group_dict, match_fn):
+                self._print('  {} already exists (2).'.format(transcode_type))
+                self._emit_decision(torrent, transcode_type, DECISION_EXISTS, 2)
+                return
         redacted_torrent = torrent_info.redacted_torrent
         if self._lookup_torrent_in_group(redacted_torrent, group_dict, match_fn):
-            print('  {} already exists (3).'.format(transcode_type))
+            self._print('  {} already exists (3).'.format(transcode_type))
+            self._emit_decision(torrent, transcode_type, DECISION_EXISTS, 3)
             return
-        print('  Found candidate for {}: https://redacted.ch/torrents.php?torrentid={}'.format(
+        self._print('  Found candidate for {}: https://redacted.ch/torrents.php?torrentid={}'.format(
             transcode_type, torrent_info.tracker_id))
+        preflight_result = preflight_transcode(torrent_info, transcode_type, group_dict)
+        for message in preflight_result.errors + preflight_result.warnings:
+            self._print('  Preflight: {}'.format(message))
+        self._emit_decision(torrent, transcode_type, DECISION_CANDIDATE, 3, preflight_result)
         if auto_create:
-            self._create_transcode_project(torrent, transcode_type)
-        else:
+            if preflight_result.errors or (preflight_result.warnings and self.skip_warnings):
+                self._print('  Skipping candidate that would not upload cleanly.')
+                return
+            self._create_transcode_project(torrent, transcode_type, group_dict)
+        elif not self.jsonl:
             input('  Press enter continue search')
 
     def _scan_torrents(self, torrents, transcode_type, match_fn, auto_create):
-        print('Found {} eligible torrents.'.format(len(torrents)))
+        torrents = list(torrents)
+        self._print('Found {} eligible torrents.'.format(len(torrents)))
         for i, torrent in enumerate(torrents):
+            self._heartbeat()
             self._check_torrent(
                 progress='{}/{}'.format(i + 1, len(torrents)),
                 torrent=torrent,
@@ -96,53 +169,104 @@ class Command(BaseCommand):
                 auto_create=auto_create,
             )
 
+    def _scan_torrents_distributed(self, torrents, transcode_type, match_fn, auto_create):
+        max_group_id = torrents.aggregate(
+            max_group_id=Max('torrent_info__redacted_torrent__torrent_group_id'))['max_group_id']
+        if max_group_id is None:
+            self._print('Found 0 eligible torrents.')
+            return
+        ensure_work_units(transcode_type, max_group_id)
+        while True:
+            self.work_unit = acquire_work_unit(transcode_type, self.node_name)
+            if self.work_unit is None:
+                break
+            self._print('Scanning groups {} to {}...'.format(
+                self.work_unit.group_id_start, self.work_unit.group_id_end))
+            try:
+                self._scan_torrents(
+                    torrents=torrents.filter(
+                        torrent_info__redacted_torrent__torrent_group_id__gte=self.work_unit.group_id_start,
+                        torrent_info__redacted_torrent__torrent_group_id__lt=self.work_unit.group_id_end,
+                    ),
+                    transcode_type=transcode_type,
+                    match_fn=match_fn,
+                    auto_create=auto_create,
+                )
+                complete_work_unit(self.work_unit, self.node_name)
+            except LeaseLost as exc:
+                self._print('  {}'.format(exc))
+            finally:
+                self.work_unit = None
+        self._print('No more work units for {}.'.format(transcode_type))
+
+    def _scan(self, torrents, transcode_type, match_fn, options):
+        if options['distributed']:
+            if options['reset_work_units']:
+                reset_work_units(transcode_type)
+            self._scan_torrents_distributed(torrents, transcode_type, match_fn, options['auto_create'])
+        else:
+            self._scan_torrents(torrents, transcode_type, match_fn, options['auto_create'])
+
     def add_arguments(self, parser):
         parser.add_argument('--redbook-flac', default=False, action='store_true')
         parser.add_argument('--mp3-v0', default=False, action='store_true')
         parser.add_argument('--mp3-320', default=False, action='store_true')
         parser.add_argument('--auto-create', default=False, action='store_true')
+        parser.add_argument('--skip-warnings', default=False, action='store_true',
+                            help='Do not auto-create projects for candidates with preflight warnings.')
+        parser.add_argument('--jsonl', default=False, action='store_true',
+                            help='Stream scan decisions as JSON Lines to stdout instead of waiting for input.')
+        parser.add_argument('--distributed', default=False, action='store_true',
+                            help='Lease torrent group ranges from the database to share the scan with other nodes.')
+        parser.add_argument('--node-name', default='{}-{}'.format(socket.gethostname(), os.getpid()))
+        parser.add_argument('--reset-work-units', default=False, action='store_true',
+                            help='Mark all work units as not scanned, starting a new distributed scan.')
 
     def handle(self, *args, **options):
         self.request_cache = RedactedRequestCache()
         self.tracker = TrackerRegistry.get_plugin(RedactedTrackerPlugin.name)
         self.realm = Realm.objects.get(name=self.tracker.name)
+        self.jsonl = options['jsonl']
+        self.skip_warnings = options['skip_warnings']
+        if options['distributed']:
+            self.node_name = options['node_name']
 
         if options[TRANSCODE_TYPE_REDBOOK_FLAC]:
-            print('Scanning for Redbook FLAC transcodes...')
-            self._scan_torrents(
-                torrents=list(Torrent.objects.filter(
+            self._print('Scanning for Redbook FLAC transcodes...')
+            self._scan(
+                torrents=Torrent.objects.filter(
                     realm=self.realm,
                     progress=1,
                     torrent_info__redacted_torrent__encoding=RedactedTorrent.ENCODING_24BIT_LOSSLESS,
                     torrent_info__redacted_torrent__remaster_year__gt=0,
-                )),
+                ),
                 transcode_type=TRANSCODE_TYPE_REDBOOK_FLAC,
                 match_fn=lambda t: t['encoding'] == 'Lossless',
-                auto_create=options['auto_create'],
+                options=options,
             )
         if options[TRANSCODE_TYPE_MP3_V0]:
-            print('Scanning for MP3 V0 transcodes...')
-            self._scan_torrents(
-                torrents=list(Torrent.objects.filter(
+            self._print('Scanning for MP3 V0 transcodes...')
+            self._scan(
+                torrents=Torrent.objects.filter(
                     realm=self.realm,
                     progress=1,
                     torrent_info__redacted_torrent__format=RedactedTorrent.FORMAT_FLAC,
                     torrent_info__redacted_torrent__remaster_year__gt=0,
-                )),
+                ),
                 transcode_type=TRANSCODE_TYPE_MP3_V0,
                 match_fn=lambda t: t['encoding'] == 'V0 (VBR)',
-                auto_create=options['auto_create'],
+                options=options,
             )
         if options[TRANSCODE_TYPE_MP3_320]:
-            print('Scanning for MP3 320 transcodes...')
-            self._scan_torrents(
-                torrents=list(Torrent.objects.filter(
+            self._print('Scanning for MP3 320 transcodes...')
+            self._scan(
+                torrents=Torrent.objects.filter(
                     realm=self.realm,
                     progress=1,
                     torrent_info__redacted_torrent__format=RedactedTorrent.FORMAT_FLAC,
                     torrent_info__redacted_torrent__remaster_year__gt=0,
-                )),
+                ),
                 transcode_type=TRANSCODE_TYPE_MP3_320,
                 match_fn=lambda t: t['encoding'] == '320',
-                auto_create=options['auto_create'],
+                options=options,
             )
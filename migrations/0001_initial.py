@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanRateLimitBudget',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('window_start', models.DateTimeField()),
+                ('num_requests', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScanWorkUnit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transcode_type', models.CharField(max_length=32)),
+                ('group_id_start', models.IntegerField()),
+                ('group_id_end', models.IntegerField()),
+                ('leased_by', models.CharField(max_length=255, null=True)),
+                ('lease_expires', models.DateTimeField(null=True)),
+                ('is_completed', models.BooleanField(default=False)),
+            ],
+            options={
+                'unique_together': {('transcode_type', 'group_id_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+def create_locks(apps, schema_editor):
+    AdmissionLock = apps.get_model('redacted_uploader', 'AdmissionLock')
+    AdmissionLock.objects.create(name='disk_space')
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('redacted_uploader', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdmissionLock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+            ],
+        ),
+        migrations.RunPython(create_locks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def create_budget(apps, schema_editor):
+    ScanRateLimitBudget = apps.get_model('redacted_uploader', 'ScanRateLimitBudget')
+    ScanRateLimitBudget.objects.get_or_create(name='redacted', defaults={'window_start': timezone.now()})
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('redacted_uploader', '0002_admissionlock'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_budget, migrations.RunPython.noop),
+    ]
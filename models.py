@@ -0,0 +1,31 @@
+from django.db import models
+
+
+class ScanWorkUnit(models.Model):
+    """A range of torrent groups to be scanned for a transcode type, leased by one node at a time."""
+
+    transcode_type = models.CharField(max_length=32)
+    group_id_start = models.IntegerField()
+    group_id_end = models.IntegerField()  # Exclusive
+    leased_by = models.CharField(max_length=255, null=True)
+    lease_expires = models.DateTimeField(null=True)
+    is_completed = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = (('transcode_type', 'group_id_start'),)
+
+
+class ScanRateLimitBudget(models.Model):
+    """Tracker request budget shared by all scanning nodes, counted over fixed windows."""
+
+    name = models.CharField(max_length=64, unique=True)
+    window_start = models.DateTimeField()
+    num_requests = models.IntegerField(default=0)
+
+
+class AdmissionLock(models.Model):
+    """Row locked with select_for_update to serialize admission decisions across processes and nodes."""
+
+    NAME_DISK_SPACE = 'disk_space'
+
+    name = models.CharField(max_length=64, unique=True)
@@ -0,0 +1,120 @@
+import html
+from collections import namedtuple
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from plugins.redacted_uploader.transcode_types import TRANSCODE_TYPE_MP3_V0, TRANSCODE_TYPE_MP3_320, \
+    TRANSCODE_TYPE_REDBOOK_FLAC
+from upload_studio.upload_metadata import MusicMetadata
+
+PRE_EMPHASIS_TERMS = {'pre-emphasized', 'pre-emphasis', 'preemphasized', 'pre-emphasis'}
+
+# Format and encoding of the torrent produced by each transcode type, as reported by Redacted.
+TRANSCODE_TARGETS = {
+    TRANSCODE_TYPE_MP3_V0: (MusicMetadata.FORMAT_MP3, MusicMetadata.ENCODING_V0),
+    TRANSCODE_TYPE_MP3_320: (MusicMetadata.FORMAT_MP3, MusicMetadata.ENCODING_320),
+    TRANSCODE_TYPE_REDBOOK_FLAC: (MusicMetadata.FORMAT_FLAC, MusicMetadata.ENCODING_LOSSLESS),
+}
+
+PreflightResult = namedtuple('PreflightResult', ['errors', 'warnings'])
+
+
+class PreflightFailed(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Transcode project failed preflight checks.'
+    default_code = 'preflight_failed'
+
+    def __init__(self, result):
+        super().__init__('Transcode project failed preflight checks:\n{}'.format(
+            '\n'.join('- {}'.format(m) for m in result.errors + result.warnings)))
+        self.result = result
+
+
+def _has_surronding_spaces(s):
+    return s != s.strip()
+
+
+def get_source_warnings(red_torrent):
+    warnings = []
+    if red_torrent['scene']:
+        warnings.append('Attention: source torrent is scene.')
+    if red_torrent['reported']:
+        warnings.append('Source torrent is reported.')
+    if _has_surronding_spaces(red_torrent['remasterTitle']):
+        warnings.append('Edition title has leading or trailing spaces. Fix manually now or after upload.')
+    if _has_surronding_spaces(red_torrent['remasterRecordLabel']):
+        warnings.append('Edition record label has leading or trailing spaces. Fix manually now or after upload.')
+    if _has_surronding_spaces(red_torrent['remasterCatalogueNumber']):
+        warnings.append('Edition catalog number has leading or trailing spaces. Fix manually now or after upload.')
+    return warnings
+
+
+def is_preemphasized(red_torrent):
+    return (any(term in red_torrent['remasterTitle'].lower() for term in PRE_EMPHASIS_TERMS) or
+            any(term in red_torrent['description'].lower() for term in PRE_EMPHASIS_TERMS))
+
+
+def _get_downsampling_errors(red_torrent, transcode_type):
+    is_24bit = red_torrent['encoding'] == MusicMetadata.ENCODING_24BIT_LOSSLESS
+    if red_torrent['format'] != MusicMetadata.FORMAT_FLAC:
+        return ['Source torrent is not FLAC.']
+    if transcode_type == TRANSCODE_TYPE_REDBOOK_FLAC and not is_24bit:
+        return ['Source torrent is already redbook FLAC.']
+    # Every transcode goes through sox to 16 bits, which is never allowed for CD sources.
+    if red_torrent['media'] == MusicMetadata.MEDIA_CD and is_24bit:
+        return ['Non-redbook format CD sources are suspicious and downmixing/resampling them is prohibited.']
+    return []
+
+
+def get_metadata_warnings(red_torrent, edition_year, edition_title, edition_record_label, edition_catalog_number):
+    warnings = []
+    if is_preemphasized(red_torrent):
+        warnings.append('Source torrent looks like it might be pre-emphasized. De-emphasizing is not supported.'
+                        ' Please check the source torrent and do it manually if needed.')
+    if not edition_year:
+        warnings.append('Metadata has empty year.')
+    if not (edition_title or edition_record_label or edition_catalog_number):
+        warnings.append('Metadata has empty title, label and catalog number.')
+    return warnings
+
+
+def get_duplicate_warnings(group_torrents, format, media, encoding, edition_year, edition_title,
+                           edition_record_label, edition_catalog_number):
+    warnings = []
+    for t in group_torrents:
+        is_same = (
+                t['format'] == format and
+                t['media'] == media and
+                t['encoding'] == encoding and
+                t['remastered'] == True and  # Can remastered be False with newer Red Gazelle?
+                t['remasterYear'] == edition_year and
+                t['remasterTitle'] == edition_title and
+                t['remasterRecordLabel'] == edition_record_label and
+                t['remasterCatalogueNumber'] == edition_catalog_number
+        )
+        if is_same:
+            warnings.append('Torrent will potentially duplicate Red torrent {}. Please confirm manually.'.format(
+                t['id']))
+    return warnings
+
+
+def run_preflight(red_torrent, group_torrents, transcode_type):
+    """Evaluate the upload rules that do not depend on the audio files, using the cached Redacted torrent dict and
+    the torrents of its group, before any files are copied or transcoded."""
+
+    # Same edition values as the metadata initialized by RedactedTorrentSourceExecutor
+    edition = dict(
+        edition_year=red_torrent['remasterYear'],
+        edition_title=html.unescape(red_torrent['remasterTitle']),
+        edition_record_label=html.unescape(red_torrent['remasterRecordLabel']),
+        edition_catalog_number=html.unescape(red_torrent['remasterCatalogueNumber']),
+    )
+    target_format, target_encoding = TRANSCODE_TARGETS[transcode_type]
+    errors = _get_downsampling_errors(red_torrent, transcode_type)
+    warnings = (
+            get_source_warnings(red_torrent) +
+            get_metadata_warnings(red_torrent, **edition) +
+            get_duplicate_warnings(group_torrents, target_format, red_torrent['media'], target_encoding, **edition)
+    )
+    return PreflightResult(errors, warnings)
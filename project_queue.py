@@ -0,0 +1,72 @@
+from time import sleep
+
+from django.db import transaction
+
+from plugins.redacted.tracker import RedactedTrackerPlugin
+from plugins.redacted_uploader.create_project import create_transcode_project, NoProjectSlotAvailable
+from plugins.redacted_uploader.disk_space import InsufficientDiskSpace, has_disk_space
+from torrents.models import Realm
+from upload_studio.models import Project
+
+NUM_CONCURRENT_PROJECTS = 4
+DISK_SPACE_RETRY_INTERVAL = 60
+
+# Decisions of scan_snatched_for_transcodes, as streamed with --jsonl
+DECISION_CANDIDATE = 'candidate'
+DECISION_EXISTS = 'exists'
+DECISION_PROJECT_EXISTS = 'project_exists'
+
+
+def _noop():
+    pass
+
+
+def create_transcode_project_when_possible(tracker_id, transcode_type, source_size, is_source_local, log,
+                                           allow_warnings=True, group_dict=None, on_wait=_noop, before_create=None):
+    """Wait for a project slot and disk space, then create the transcode project. before_create runs inside the
+    creating transaction and can refuse the creation by returning False, in which case None is returned. A group_dict
+    the caller already validated is reused for the preflight checks instead of fetching the group again.
+
+    PreflightFailed and any other APIException from create_transcode_project are left to the caller."""
+
+    download_location = Realm.objects.get(name=RedactedTrackerPlugin.name).get_preferred_download_location()
+    while True:
+        printed = False
+        while Project.objects.filter(is_finished=False).count() >= NUM_CONCURRENT_PROJECTS:
+            if not printed:
+                log('  Waiting for project slots...')
+                printed = True
+            on_wait()
+            sleep(1)
+
+        # Wait for space before creating, as every creation attempt costs tracker requests
+        printed = False
+        while not has_disk_space(source_size, transcode_type, download_location, is_source_local):
+            if not printed:
+                log('  Waiting for disk space...')
+                printed = True
+            on_wait()
+            sleep(DISK_SPACE_RETRY_INTERVAL)
+
+        log('  Creating project...')
+        try:
+            with transaction.atomic():
+                if before_create and not before_create():
+                    return None
+                # Slots are checked again under the admission lock, as other nodes create projects concurrently
+                project = create_transcode_project(
+                    tracker_id=tracker_id,
+                    transcode_type=transcode_type,
+                    allow_warnings=allow_warnings,
+                    group_dict=group_dict,
+                    max_unfinished_projects=NUM_CONCURRENT_PROJECTS,
+                )
+            break
+        except NoProjectSlotAvailable:
+            log('  Project slots were taken by another node.')
+        except InsufficientDiskSpace as exc:
+            log('  Waiting for disk space: {}'.format(exc.detail))
+            on_wait()
+            sleep(DISK_SPACE_RETRY_INTERVAL)
+    log('  Created project for https://redacted.ch/torrents.php?torrentid={}'.format(tracker_id))
+    return project
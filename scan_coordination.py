@@ -0,0 +1,140 @@
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from time import sleep
+
+from django.db import transaction
+from django.db.models import Q, F
+from django.utils import timezone
+
+from Harvest.utils import get_logger
+from plugins.redacted.client import RedactedClient
+from plugins.redacted_uploader.models import ScanWorkUnit, ScanRateLimitBudget
+
+logger = get_logger(__name__)
+
+WORK_UNIT_NUM_GROUPS = 10000
+LEASE_DURATION = timedelta(minutes=10)
+
+RATE_LIMIT_BUDGET_NAME = 'redacted'
+RATE_LIMIT_WINDOW = timedelta(seconds=10)
+RATE_LIMIT_MAX_REQUESTS = 5
+
+_budget_executor = None
+_budget_executor_lock = threading.Lock()
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def ensure_work_units(transcode_type, max_group_id):
+    for group_id_start in range(0, max_group_id + 1, WORK_UNIT_NUM_GROUPS):
+        ScanWorkUnit.objects.get_or_create(
+            transcode_type=transcode_type,
+            group_id_start=group_id_start,
+            defaults={
+                'group_id_end': group_id_start + WORK_UNIT_NUM_GROUPS,
+            },
+        )
+
+
+def reset_work_units(transcode_type):
+    ScanWorkUnit.objects.filter(transcode_type=transcode_type).update(
+        is_completed=False,
+        leased_by=None,
+        lease_expires=None,
+    )
+
+
+@transaction.atomic
+def acquire_work_unit(transcode_type, node_name):
+    """Lease the next work unit that is not completed and is not leased by a live node. Returns None when the scan
+    of the transcode type is done."""
+
+    now = timezone.now()
+    work_unit = ScanWorkUnit.objects.select_for_update().filter(
+        Q(lease_expires=None) | Q(lease_expires__lt=now) | Q(leased_by=node_name),
+        transcode_type=transcode_type,
+        is_completed=False,
+    ).order_by('group_id_start').first()
+    if work_unit is None:
+        return None
+    work_unit.leased_by = node_name
+    work_unit.lease_expires = now + LEASE_DURATION
+    work_unit.save(update_fields=('leased_by', 'lease_expires'))
+    logger.info('Node {} leased groups [{}, {}) for {}.',
+                node_name, work_unit.group_id_start, work_unit.group_id_end, transcode_type)
+    return work_unit
+
+
+def renew_lease(work_unit, node_name):
+    """Heartbeat for a leased work unit. Raises LeaseLost if the lease expired and another node took it over."""
+
+    num_updated = ScanWorkUnit.objects.filter(
+        id=work_unit.id,
+        leased_by=node_name,
+        is_completed=False,
+    ).update(lease_expires=timezone.now() + LEASE_DURATION)
+    if not num_updated:
+        raise LeaseLost('Lease on work unit {} was lost by {}.'.format(work_unit.id, node_name))
+
+
+def complete_work_unit(work_unit, node_name):
+    num_updated = ScanWorkUnit.objects.filter(id=work_unit.id, leased_by=node_name).update(
+        is_completed=True,
+        leased_by=None,
+        lease_expires=None,
+    )
+    if not num_updated:
+        raise LeaseLost('Lease on work unit {} was lost by {}.'.format(work_unit.id, node_name))
+
+
+def _try_acquire_request_slot():
+    # Runs on the budget thread in autocommit mode, so every statement commits right away
+    now = timezone.now()
+    budget = ScanRateLimitBudget.objects.filter(name=RATE_LIMIT_BUDGET_NAME)
+    budget.filter(window_start__lte=now - RATE_LIMIT_WINDOW).update(window_start=now, num_requests=0)
+    if budget.filter(num_requests__lt=RATE_LIMIT_MAX_REQUESTS).update(num_requests=F('num_requests') + 1):
+        return None
+    return budget.values_list('window_start', flat=True).get() + RATE_LIMIT_WINDOW - now
+
+
+def _get_budget_executor():
+    global _budget_executor
+    with _budget_executor_lock:
+        if _budget_executor is None:
+            _budget_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='redacted_rate_limit')
+        return _budget_executor
+
+
+def acquire_request_slot():
+    """Block until a tracker request fits in the budget shared by all processes and nodes.
+
+    The budget is counted on a dedicated thread, which has its own database connection. That keeps the counter out of
+    the caller's transaction, so a request made while creating a project does not lock the budget until it commits."""
+
+    while True:
+        wait_time = _get_budget_executor().submit(_try_acquire_request_slot).result()
+        if wait_time is None:
+            return
+        sleep(max(wait_time.total_seconds(), 0.1))
+
+
+def install_shared_rate_limit():
+    """Make every request the Redacted client sends in this process wait for the shared budget. Cache hits in the
+    request cache never reach the client, so they are not counted. Installed when the app is ready, so the web
+    server, workers and management commands all draw from the same budget."""
+
+    original_request = RedactedClient.request
+    if getattr(original_request, 'uses_shared_rate_limit', False):
+        return
+
+    @functools.wraps(original_request)
+    def request(self, *args, **kwargs):
+        acquire_request_slot()
+        return original_request(self, *args, **kwargs)
+
+    request.uses_shared_rate_limit = True
+    RedactedClient.request = request
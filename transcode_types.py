@@ -0,0 +1,8 @@
+TRANSCODE_TYPE_MP3_V0 = 'mp3_v0'
+TRANSCODE_TYPE_MP3_320 = 'mp3_320'
+TRANSCODE_TYPE_REDBOOK_FLAC = 'redbook_flac'
+TRANSCODE_TYPES = {
+    TRANSCODE_TYPE_MP3_V0,
+    TRANSCODE_TYPE_MP3_320,
+    TRANSCODE_TYPE_REDBOOK_FLAC,
+}